@@ -5,8 +5,9 @@
     stdout.
 """
 
-import re
+import io
 import signal
+import struct
 import sys
 
 __author__ = "Mark A. Matthews"
@@ -15,10 +16,6 @@ __license__ = "Public Domain"
 __version__ = "1.0"
 
 
-TYPE1_SENTENCE_IDS = (b'z', b'A', b'B', b'C', b'D', b'E', b'G', b'I', b'K',
-                      b'L', b'Q', b'S', b'T', b'l')
-
-
 def decodeGarmin500SeriesData(dataStream):
     '''
     Decodes a buffered Garmin 500 Series RS-232 data message.
@@ -38,27 +35,158 @@ def decodeGarmin500SeriesData(dataStream):
     lines = dataStream.splitlines()
 
     for line in lines:
+        # A single lookup on the initial byte picks out both the sentence
+        # type and, for Type 1 sentences, the specific decoder.
+        decoder = SENTENCE_DECODERS[line[0]] if line else None
+
+        # Check for Type 2 sentences, "w<2 digits>..."
+        if decoder is TYPE2_SENTENCE:
+            if len(line) >= 3 and line[1:3].isdigit():
+                decodedSentences.append(decodeType2Sentence(line))
+                continue
+
         # Check for Type 1 sentences
-        if line.startswith(TYPE1_SENTENCE_IDS):
+        elif decoder is not None:
+            decodedSentence = {"Type": "Type 1"}
             try:
-                decodedSentence = decodeType1Sentence(line.decode('ascii'))
-            except UnicodeDecodeError:
-                print("Error: Non-ASCII characters encountered. "
+                decoder(line, decodedSentence)
+            except ValueError:
+                # Includes UnicodeDecodeError from the text fields
+                print("Error: Malformed or non-ASCII sentence encountered. "
                       "Skipping sentence.")
+                continue
 
-        # Check for Type 2 sentences
-        elif re.match(rb'^w[0-9][0-9].*', line):
-            decodedSentence = decodeType2Sentence(line)
-
-        else:
-            print(f"Unknown sentence format: '{line}'")
+            decodedSentences.append(decodedSentence)
             continue
 
-        decodedSentences.append(decodedSentence)
+        print(f"Unknown sentence format: '{line}'")
 
     return decodedSentences
 
 
+def _decodeGpsAltitude(sentence, data):
+    # GPS altitude in feet . Format is "z<feet>"
+    data["GPS Altitude (ft)"] = int(sentence[1:])
+
+
+# Output template for Type 1 latitude and longitude, filled in with a single
+# % rather than building an f-string piece by piece.
+DEGREES_MINUTES_FORMAT = "%s %s°%s.%s'"
+
+
+def _decodeLatitude(sentence, data):
+    # Latitude: Format is "A<direction><degrees>.<minutes>"
+    sentence = sentence.decode('ascii')
+    data["Latitude"] = DEGREES_MINUTES_FORMAT % (sentence[1], sentence[3:5],
+                                                 sentence[6:8], sentence[8:])
+
+
+def _decodeLongitude(sentence, data):
+    # Longitude: Format is "B<direction><degrees>.<minutes>"
+    sentence = sentence.decode('ascii')
+    data["Longitude"] = DEGREES_MINUTES_FORMAT % (sentence[1], sentence[3:6],
+                                                  sentence[7:9], sentence[9:])
+
+
+def _decodeTrack(sentence, data):
+    # Track in degrees (assuming it's the rest of the string as a float)
+    data["Track (degrees)"] = float(sentence[1:])
+
+
+def _decodeGroundSpeed(sentence, data):
+    # Ground Speed: Format is "D<knots>"
+    data["Ground Speed (knots)"] = int(sentence[1:])
+
+
+def _decodeDistanceToWpt(sentence, data):
+    if sentence[1:3] == b"--":
+        # Waypoint not defined
+        data["Distance to Wpt (nm)"] = sentence[1:].decode('ascii')
+    else:
+        # Distance to next waypoint: Format is "E<deci-nm>"
+        data["Distance to Wpt (nm)"] = float(sentence[1:]) / 10.0
+
+
+def _decodeXtkError(sentence, data):
+    if sentence[1:3] == b"--":
+        # Waypoint not defined
+        data["XTK Error (nm)"] = sentence[1:].decode('ascii')
+    else:
+        # Cross track error: Format is G<L|R><centi-nm>
+        data["XTK Error (nm)"] = sentence[1:2].decode('ascii') + \
+                           str(float(sentence[2:]) / 100.0)
+
+
+def _decodeDesiredTrack(sentence, data):
+    if sentence[1:3] == b"--":
+        # Waypoint not defined
+        data["TRK (degrees)"] = sentence[1:].decode('ascii')
+    else:
+        # Desired track (degrees): Format is I<deci-degrees>"
+        data["TRK (degrees)"] = float(sentence[1:]) / 10.0
+
+
+def _decodeWaypoint(sentence, data):
+    # Next waypoint: Format is "K<ccccc>" The documentation calls this the
+    # "destination" waypoint, but it's actually the name for the waypoint in
+    # the active leg.
+    data["Wpt"] = sentence[1:].decode('ascii')
+
+
+def _decodeBearing(sentence, data):
+    if sentence[1:3] == b"--":
+        # Waypoint not defined
+        data["BRG (degrees)"] = sentence[1:].decode('ascii')
+    else:
+        # Bearing to next waypoint: Format is "L<deci-degrees>"
+        data["BRG (degrees)"] = float(sentence[1:]) / 10.0
+
+
+def _decodeMagVar(sentence, data):
+    # Magnetic Variation: Format is "Q<E|W><deci-degrees>"
+    data["Mag Var (degrees)"] = sentence[1:2].decode('ascii') + \
+                     str(float(sentence[2:]) / 10.0)
+
+
+def _decodeNavValid(sentence, data):
+    # NAV valid flag: Format is "S----<N|->"
+    data["NAV Valid"] = sentence[5:6] == b"-"
+
+
+def _decodeWarningStatus(sentence, data):
+    # Warning status: Format is always "T<--------->"
+    data["Warning Status"] = sentence[1:].decode('ascii')
+
+
+def _decodeDistanceToDest(sentence, data):
+    if sentence[1:3] == b"--":
+        # Waypoint not defined
+        data["Distance to Dest (nm)"] = sentence[1:].decode('ascii')
+    else:
+        # Distance to destination: Format is "l<deci-nm>". This really is the
+        # destination waypoint.
+        data["Distance to Dest (nm)"] = float(sentence[1:]) / 10.0
+
+
+# Type 1 decoders, keyed by the sentence's initial character
+TYPE1_DECODERS = {
+    b"z": _decodeGpsAltitude,
+    b"A": _decodeLatitude,
+    b"B": _decodeLongitude,
+    b"C": _decodeTrack,
+    b"D": _decodeGroundSpeed,
+    b"E": _decodeDistanceToWpt,
+    b"G": _decodeXtkError,
+    b"I": _decodeDesiredTrack,
+    b"K": _decodeWaypoint,
+    b"L": _decodeBearing,
+    b"Q": _decodeMagVar,
+    b"S": _decodeNavValid,
+    b"T": _decodeWarningStatus,
+    b"l": _decodeDistanceToDest,
+}
+
+
 def decodeType1Sentence(sentence):
     '''
     Type 1 Sentences deal with the current 3D position, and course details to
@@ -72,90 +200,9 @@ def decodeType1Sentence(sentence):
     data = {"Type": "Type 1"}
 
     # Check sentence type based on the initial character and decode accordingly
-
-    match sentence[0]:
-        case  "z":
-            # GPS altitude in feet . Format is "z<feet>"
-            data["GPS Altitude (ft)"] = int(sentence[1:])
-
-        case  "A":
-            # Latitude: Format is "A<direction><degrees>.<minutes>"
-            data["Latitude"] = \
-               f"{sentence[1]} {sentence[3:5]}°{sentence[6:8]}.{sentence[8:]}'"
-
-        case  "B":
-            # Longitude: Format is "B<direction><degrees>.<minutes>"
-            data["Longitude"] = \
-               f"{sentence[1]} {sentence[3:6]}°{sentence[7:9]}.{sentence[9:]}'"
-
-        case  "C":
-            # Track in degrees (assuming it's the rest of the string as a float)
-            data["Track (degrees)"] = float(sentence[1:])
-
-        case  "D":
-            # Ground Speed: Format is "D<knots>"
-            data["Ground Speed (knots)"] = int(sentence[1:])
-
-        case  "E":
-            if sentence[1:3] == "--":
-                # Waypoint not defined
-                data["Distance to Wpt (nm)"] = sentence[1:]
-            else:
-                # Distance to next waypoint: Format is "E<deci-nm>"
-                data["Distance to Wpt (nm)"] = float(sentence[1:]) / 10.0
-
-        case  "G":
-            if sentence[1:3] == "--":
-                # Waypoint not defined
-                data["XTK Error (nm)"] = sentence[1:]
-            else:
-                # Cross track error: Format is G<L|R><centi-nm>
-                data["XTK Error (nm)"] = sentence[1] + \
-                                          str(float(sentence[2:]) / 100.0)
-
-        case  "I":
-            if sentence[1:3] == "--":
-                # Waypoint not defined
-                data["TRK (degrees)"] = sentence[1:]
-            else:
-                # Desired track (degrees): Format is I<deci-degrees>"
-                data["TRK (degrees)"] = float(sentence[1:]) / 10.0
-
-        case  "K":
-            # Next waypoint: Format is "K<ccccc>" The documentation calls this
-            # the "destination" waypoint, but it's actually the name for the
-            # waypoint in the active leg.
-            data["Wpt"] = sentence[1:]
-
-        case  "L":
-            if sentence[1:3] == "--":
-                # Waypoint not defined
-                data["BRG (degrees)"] = sentence[1:]
-            else:
-                # Bearing to next waypoint: Format is "L<deci-degrees>"
-                data["BRG (degrees)"] = float(sentence[1:]) / 10.0
-
-        case  "Q":
-            # Magnetic Variation: Format is "Q<E|W><deci-degrees>"
-            data["Mag Var (degrees)"] = sentence[1] + \
-                                         str(float(sentence[2:]) / 10.0)
-
-        case  "S":
-            # NAV valid flag: Format is "S----<N|->"
-            data["NAV Valid"] = sentence[5] == "-"
-
-        case  "T":
-            # Warning status: Format is always "T<--------->"
-            data["Warning Status"] = sentence[1:]
-
-        case  "l":
-            if sentence[1:3] == "--":
-                # Waypoint not defined
-                data["Distance to Dest (nm)"] = sentence[1:]
-            else:
-                # Distance to destination: Format is "l<deci-nm>". This really
-                # is the destination waypoint.
-                data["Distance to Dest (nm)"] = float(sentence[1:]) / 10.0
+    decoder = TYPE1_DECODERS.get(sentence[:1])
+    if decoder is not None:
+        decoder(sentence, data)
 
     return data
 
@@ -169,6 +216,24 @@ LAT_DEG_MASK = 0x7f
 MIN_MASK = 0x3f
 CENTIMIN_MASK = 0x7f
 
+# Indexed by the ACTIVE_LEG and LAST_LEG bits, shifted down
+LEG_FLAGS_SHIFT = 5
+SEQ_SUFFIXES = ("            ",     # neither
+                " Active     ",     # ACTIVE_LEG
+                "        Last",     # LAST_LEG
+                " Active Last")     # ACTIVE_LEG | LAST_LEG
+
+# Leg numbers and degrees each come from a single byte, so their strings can
+# all be made up front.
+SMALL_INT_STRS = tuple(str(i) for i in range(256))
+
+# Position fields of a Type 2 sentence, starting at byte 9: lat hemisphere and
+# degrees, lat minutes, lat centiminutes, lon hemisphere, lon degrees, lon
+# minutes, lon centiminutes, then Magnetic Variation as 16 bits
+# twos-compliment.
+TYPE2_POSITION_OFFSET = 9
+TYPE2_POSITION = struct.Struct('>7Bh')
+
 
 def decodeType2Sentence(sentence):
     '''
@@ -182,49 +247,64 @@ def decodeType2Sentence(sentence):
 
     '''
 
-    data = {"Type": "Type 2"}
-
-    data["Id"] = sentence[0:3].decode('ascii')
-    lastLeg = (sentence[3]) & LAST_LEG != 0
-    activeLeg = (sentence[3]) & ACTIVE_LEG != 0
-    legNo = (sentence[3]) & LEG_NUM_MASK
-    data["Seq"] = str(legNo)
-    if activeLeg and lastLeg:
-        data["Seq"] += " Active Last"
-    elif activeLeg:
-        data["Seq"] += " Active     "
-    elif lastLeg:
-        data["Seq"] += "        Last"
-    else:
-        data["Seq"] += "            "
+    sentenceId = sentence[:3].decode('ascii')
+    # The active and last leg flags are adjacent bits, so together they
+    # index straight into SEQ_SUFFIXES.
+    flags = sentence[3]
+    legNo = flags & LEG_NUM_MASK
+    legFlags = flags >> LEG_FLAGS_SHIFT & 0x3
+    seq = SMALL_INT_STRS[legNo] + SEQ_SUFFIXES[legFlags]
 
     if len(sentence) < 5:
         # No waypoints defined
-        return data
-
-    data["Wpt"] = sentence[4:9].decode('ascii')
-    latDir = "S" if (sentence[9]) & SOUTH_NORTH else "N"
-    latDeg = (sentence[9]) & LAT_DEG_MASK
-    latMin = (sentence[10]) & MIN_MASK
-    latCentiMin = (sentence[11]) & CENTIMIN_MASK
-    data["Lat"] = latDir + str(latDeg) + "° " + str(float(latMin) +
-                                                    float(latCentiMin) / 10.0)
-    lonDir = "W" if (sentence[12]) & EAST_WEST else "E"
-    lonDeg = sentence[13]
-    lonMin = sentence[14] & MIN_MASK
-    lonCentiMin = (sentence[15]) & CENTIMIN_MASK
-    data["Lon"] = lonDir + str(lonDeg) + "° " + str(float(lonMin) +
-                                                    float(lonCentiMin) / 10.0)
-
-    # Magnetic Variation is encoded as 16 bits twos-compliment, in 16ths of
-    # degrees. Here we swizzle it into an int, then a float.
-    mv = sentence[16] << 8 | sentence[17]
-    mvNeg = -1 if mv & 0x8000 else 1
-    if mvNeg == -1:
-        mv = ((0xffff - mv) + 1) * mvNeg
-    data["Mag Var"] = mv / 16.0
+        return {"Type": "Type 2", "Id": sentenceId, "Seq": seq}
 
-    return data
+    (latSouth, latDeg, latMin, latCentiMin,
+     lonWest, lonDeg, lonMin, lonCentiMin, mv) = unpackType2Position(sentence)
+
+    latDir = "S" if latSouth else "N"
+    lat = latDir + SMALL_INT_STRS[latDeg] + "° " + \
+        str(float(latMin) + float(latCentiMin) / 10.0)
+    lonDir = "W" if lonWest else "E"
+    lon = lonDir + SMALL_INT_STRS[lonDeg] + "° " + \
+        str(float(lonMin) + float(lonCentiMin) / 10.0)
+
+    return {"Type": "Type 2", "Id": sentenceId, "Seq": seq,
+            "Wpt": sentence[4:9].decode('ascii'), "Lat": lat, "Lon": lon,
+            "Mag Var": mv / 16.0}
+
+
+def unpackType2Position(sentence):
+    '''
+    Unpack the binary position fields (bytes 9 to 17) of a Type 2 sentence.
+
+    This only does integer bit twiddling and returns plain ints, so that it's
+    kept apart from building the decoded sentence.
+
+    :param sentence:  An individual Type 2 sentence with waypoints defined
+    :return: Tuple of (latSouth, latDeg, latMin, latCentiMin, lonWest, lonDeg,
+             lonMin, lonCentiMin, mv), with mv in 16ths of degrees.
+
+    '''
+
+    # The 'h' field hands back Magnetic Variation already signed, in 16ths
+    # of degrees.
+    latH, latM, latC, lonH, lonDeg, lonM, lonC, mv = \
+        TYPE2_POSITION.unpack_from(sentence, TYPE2_POSITION_OFFSET)
+
+    return (latH & SOUTH_NORTH, latH & LAT_DEG_MASK, latM & MIN_MASK,
+            latC & CENTIMIN_MASK, lonH & EAST_WEST, lonDeg, lonM & MIN_MASK,
+            lonC & CENTIMIN_MASK, mv)
+
+
+# Marks Type 2 sentences in SENTENCE_DECODERS, which are handed to
+# decodeType2Sentence() once their format has been checked.
+TYPE2_SENTENCE = object()
+
+# Type 1 sentence decoders, or TYPE2_SENTENCE, indexed by the sentence's
+# initial byte
+SENTENCE_DECODERS = [TYPE1_DECODERS.get(bytes((b,))) for b in range(256)]
+SENTENCE_DECODERS[ord('w')] = TYPE2_SENTENCE
 
 
 def handler(signum, frame):  # pylint: disable=unused-argument
@@ -234,85 +314,139 @@ def handler(signum, frame):  # pylint: disable=unused-argument
 
 STX = b'\x02'
 ETX = b'\x03'
+EOM = b'\r\n\x03'
+READ_SIZE = 65536
+# Read size for piped/redirected stdin. read1() hands a request this size
+# straight to the underlying read() when the buffer is empty.
+STDIN_READ_SIZE = 1 << 18
 
 
-if __name__ == "__main__":
-    buffer = bytearray()
-    isBuffering = False
-    preBufferEnd = 0
+def skipToEtx(stream, readSize=READ_SIZE):
+    """
+    Discard input up to and including the first ETX, so that framing starts
+    on a message boundary.
 
-    signal.signal(signal.SIGINT, handler)
+    :param stream: A binary stream supporting read1().
+    :param readSize: Maximum number of bytes to ask for per read1().
+    :return: Any bytes read past the ETX, or None if the stream ended first.
 
-    print("Waiting for a full message to go by....")
+    """
 
     while True:
-        # Read one byte at a time from standard input
-        byte = sys.stdin.buffer.read(1)
+        chunk = stream.read1(readSize)
 
-        if byte == b'':
-            # End of input stream (e.g., Ctrl+D), stop processing
-            print("Exiting...")
-            sys.exit(1)
+        if chunk == b'':
+            # End of input stream (e.g., Ctrl+D)
+            return None
 
-        if byte == ETX:
-            break
+        etx = chunk.find(ETX)
+        if etx != -1:
+            return chunk[etx + 1:]
 
-    print("Listening for Garmin 500 Series data (STX/ETX delimited)...")
 
-    while True:
-        # Read one byte at a time from standard input
-        byte = sys.stdin.buffer.read(1)
+def frameMessages(stream, pending=b'', readSize=READ_SIZE):
+    """
+    Split a binary stream into STX/ETX delimited messages.
+
+    Weirdly, Type 2 messages include binary values buried within otherwise
+    ASCII messages - because of this we treat the incoming values as a
+    bytearray. Also, since there's binary values in the Type 2 messages, we
+    have to watch out for embedded ETX values. This can happen if the
+    degrees/mins/centimin values coincidentally equal 3. We mitigate this a
+    bit by only accepting an ETX that follows a carraige return and linefeed,
+    but even that can falsely trigger when 13 deg 10 min 3 centimin is
+    encountered. So just be careful when operating around the west coast of
+    equitorial Africa.
+
+    :param stream: A binary stream supporting read1().
+    :param pending: Bytes already read from the stream but not yet framed.
+    :param readSize: Maximum number of bytes to ask for per read1().
+    :return: Generator of complete messages, STX and ETX included.
+
+    """
 
-        if byte == b'':
+    buf = bytearray(pending)
+    pos = 0
+    scan = 0
+
+    while True:
+        stx = buf.find(STX, pos)
+        if stx == -1:
+            # Nothing worth keeping until the next STX shows up
+            pos = len(buf)
+        else:
+            end = buf.find(EOM, max(stx + 1, scan))
+            if end != -1:
+                end += len(EOM)
+                # Copy the whole message out in one go
+                with memoryview(buf) as view:
+                    message = bytes(view[stx:end])
+                yield message
+                pos = scan = end
+                continue
+
+            # Don't rescan what's already been searched, but allow for an
+            # EOM that straddles the next read.
+            pos = stx
+            scan = max(stx + 1, len(buf) - len(EOM) + 1)
+
+        chunk = stream.read1(readSize)
+
+        if chunk == b'':
             # End of input stream (e.g., Ctrl+D), stop processing
-            print("Exiting...")
-            sys.exit(0)
+            return
 
-        if byte == STX and not isBuffering:
-            # Start buffering when STX is detected
-            buffer = bytearray()
-            isBuffering = True
-            continue
+        # Drop consumed messages once per read, rather than once per message
+        del buf[:pos]
+        scan -= pos
+        pos = 0
+        buf += chunk
+
+
+def splitMessages(data, start=0):
+    """
+    Split an in-memory buffer into STX/ETX delimited messages, framed by
+    frameMessages().
 
-        # Weirdly, Type 2 messages include binary values buried within
-        # otherwise ASCII messages - because of this we treat the incoming
-        # values as a bytearray. Also, since there's binary values in the
-        # Type 2 messages, we have to watch out for embedded ETX values. This
-        # can happen if the degrees/mins/centimin values coincidentally
-        # equal 3. We mitigate this a bit by looking for a linefeed (0x0a)
-        # before a valid ETX, but even that is vulnerable to a false detection
-        # of a degree/min happens to be 10 deg 03 min, or 10 min 03 centimin.
-        # We try to mitigate that a bit more by trying to scan for
-        # carraige return, then linefeed, and then STX, but even that can
-        # falsely trigger when 13 deg 10 min 3 centimin is encountered.
-        # So just be careful when operating around the west coast of equitorial
-        # Africa.
-
-        if isBuffering:
-            if preBufferEnd == 2:
-                if byte == ETX:
-                    # Stop buffering and decode when ETX is detected
-                    preBufferEnd = 0
-                    isBuffering = False
-                    decoded_data = decodeGarmin500SeriesData(buffer)
-
-                    # Output the decoded data
-                    print("\nDecoded Garmin 500 Series Data:")
-                    for entry in decoded_data:
-                        print(entry)
-
-                    # Reset buffer and wait for next STX
-                    buffer = bytearray()
-                else:
-                    preBufferEnd = 0
-
-            if byte == b'\r' and preBufferEnd == 0:
-                # Potential end of record coming up
-                preBufferEnd = 1
-
-            if byte == b'\n' and preBufferEnd == 1:
-                # Now its really coming up
-                preBufferEnd = 2
-
-            # Accumulate data into the buffer
-            buffer += byte
+    :param data: The buffered data.
+    :param start: Offset in data to start looking for the first STX.
+    :return: List of complete messages, STX and ETX included. Any trailing
+             partial message is dropped.
+
+    """
+
+    stream = io.BytesIO(data)
+    stream.seek(start)
+
+    return list(frameMessages(stream))
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGINT, handler)
+
+    stdin = sys.stdin.buffer
+    readSize = READ_SIZE
+    if not sys.stdin.isatty():
+        # Piped or redirected input, so pull it in with fewer, larger reads.
+        # Terminal input is left alone.
+        readSize = STDIN_READ_SIZE
+
+    print("Waiting for a full message to go by....")
+
+    pending = skipToEtx(stdin, readSize)
+    if pending is None:
+        print("Exiting...")
+        sys.exit(1)
+
+    print("Listening for Garmin 500 Series data (STX/ETX delimited)...")
+
+    for message in frameMessages(stdin, pending, readSize):
+        # Strip the STX/ETX before decoding
+        decoded_data = decodeGarmin500SeriesData(message[1:-1])
+
+        # Output the decoded data, the whole message in one write
+        sys.stdout.write("\nDecoded Garmin 500 Series Data:\n" +
+                         "".join([f"{entry!r}\n" for entry in decoded_data]))
+
+    print("Exiting...")
+    sys.exit(0)
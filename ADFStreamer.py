@@ -11,10 +11,13 @@
 """
 
 import argparse
+import os
 import signal
 import sys
 import time
 
+from ADFDecoder import ETX, STX, splitMessages
+
 
 __author__ = "Mark A. Matthews"
 __copyright__ = "Copyright 2024 Mark A. Matthews"
@@ -28,8 +31,42 @@ def handler(signum, frame):  # pylint: disable=unused-argument
     sys.exit(0)
 
 
-STX = b'\x02'
-ETX = b'\x03'
+def writeMessage(fd, msg):
+    """
+    Write all of msg to a file descriptor, picking up after any short write.
+    """
+
+    view = memoryview(msg)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def writeMessages(fd, messages):
+    """
+    Write all of messages to a file descriptor, gathering as many as the
+    system allows into each writev() call.
+    """
+
+    try:
+        iovMax = os.sysconf("SC_IOV_MAX")
+    except (AttributeError, ValueError, OSError):
+        iovMax = -1
+    if iovMax <= 0:
+        iovMax = 1024
+
+    pending = [memoryview(msg) for msg in messages]
+    first = 0
+    while first < len(pending):
+        written = os.writev(fd, pending[first:first + iovMax])
+
+        # Skip past whatever went out in full, and trim the rest of a
+        # partially written message.
+        while written and written >= len(pending[first]):
+            written -= len(pending[first])
+            first += 1
+        if written:
+            pending[first] = pending[first][written:]
+
 
 # Tell pylint to shutup about the  module variables it thinks should be
 # constant.
@@ -51,83 +88,13 @@ if __name__ == "__main__":
         print("-s delay must not be negative", file=sys.stderr)
         sys.exit(1)
 
-    buffer = bytearray()
-    isBuffering = False
-    preBufferEnd = 0
-    messages = []
-
     signal.signal(signal.SIGINT, handler)
 
-    # Read messages from the specified file
+    # Read messages from the specified file. It's bounded, so just slurp the
+    # whole thing and frame it in memory.
     try:
         with open(args.filename, "rb") as file:
-            # Peek at the first byte in the file
-            byte = file.read(1)
-            if byte == b'':
-                # End of input stream (e.g., Ctrl+D), stop processing
-                print("File is empty", file=sys.stderr)
-                sys.exit(1)
-
-            if byte == STX:
-                # File starts with STX. We'll assume it's truly the
-                # beginning of a message. Head back to the start.
-                file.seek(0)
-            else:
-                print("Waiting for a full message to go by....",
-                      file=sys.stderr)
-
-                while True:
-                    # Read one byte at a time from standard input
-                    byte = file.read(1)
-
-                    if byte == b'':
-                        # End of input stream (e.g., Ctrl+D), stop processing
-                        print("Exiting...", file=sys.stderr)
-                        sys.exit(1)
-
-                    if byte == ETX:
-                        break
-
-                print("Found first ETX.", file=sys.stderr)
-
-            while True:
-                # Read one byte at a time from standard input
-                byte = file.read(1)
-
-                if byte == b'':
-                    # End of input stream (e.g., Ctrl+D), stop processing
-                    print("No more messages...", file=sys.stderr)
-                    break
-
-                if byte == STX and not isBuffering:
-                    # Start buffering when STX is detected
-                    buffer = bytearray()
-                    buffer += byte
-                    isBuffering = True
-                    continue
-
-                if isBuffering:
-                    if preBufferEnd == 2:
-                        if byte == ETX:
-                            buffer += byte
-                            # Stop buffering this message
-                            preBufferEnd = 0
-                            isBuffering = False
-                            messages.append(buffer)
-                            continue
-
-                        preBufferEnd = 0
-
-                    if byte == b'\r' and preBufferEnd == 0:
-                        # Potential end of record coming up
-                        preBufferEnd = 1
-
-                    if byte == b'\n' and preBufferEnd == 1:
-                        # Now its really coming up
-                        preBufferEnd = 2
-
-                    # Accumulate data into the buffer
-                    buffer += byte
+            data = file.read()
     except FileNotFoundError:
         print(f"Error: File '{args.filename}' not found.", file=sys.stderr)
         sys.exit(1)
@@ -135,11 +102,44 @@ if __name__ == "__main__":
         print(f"Error reading file '{args.filename}': {e}", file=sys.stderr)
         sys.exit(1)
 
+    if data == b'':
+        print("File is empty", file=sys.stderr)
+        sys.exit(1)
+
+    if data[:1] == STX:
+        # File starts with STX. We'll assume it's truly the beginning of a
+        # message.
+        start = 0
+    else:
+        print("Waiting for a full message to go by....", file=sys.stderr)
+
+        start = data.find(ETX) + 1
+        if start == 0:
+            print("Exiting...", file=sys.stderr)
+            sys.exit(1)
+
+        print("Found first ETX.", file=sys.stderr)
+
+    messages = splitMessages(data, start)
+    print("No more messages...", file=sys.stderr)
+
     # Now emit messages[] one element at a time, to stdout
     print(f"Stream {len(messages)} messages at {args.delay} messages/second",
           file=sys.stderr)
 
-    for msg in messages:
-        sys.stdout.buffer.write(msg)
-        sys.stdout.buffer.flush()
-        time.sleep(args.delay)
+    # Every message is written whole and must go out straight away, so skip
+    # the BufferedWriter and write to stdout's file descriptor directly.
+    out = sys.stdout.fileno()
+
+    if args.delay == 0.0 and hasattr(os, "writev"):
+        # No pacing wanted, so hand them all over in as few syscalls as
+        # possible.
+        writeMessages(out, messages)
+    else:
+        # Schedule against a monotonic clock, so the time spent writing
+        # doesn't accumulate as drift.
+        deadline = time.perf_counter()
+        for msg in messages:
+            deadline += args.delay
+            writeMessage(out, msg)
+            time.sleep(max(0.0, deadline - time.perf_counter()))